@@ -0,0 +1,272 @@
+# Append-only assignment event log.
+#
+# Callers hand events to an in-process queue and return immediately; a
+# background thread owns its own connection and writes them in batches.
+# Columns are integer coded (event type, user names via event_users) so a
+# day of events stays small and the ts index keeps time-range reads fast.
+#
+#   python event_log.py --date 2026-10-19            # dump a day's events
+#   python event_log.py --date 2026-10-19 --replay   # final assignee per task
+
+import argparse
+import csv
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+DB_PATH = "flight_tasks.db"
+
+# Event codes
+ASSIGN = 1
+UNASSIGN = 2
+HOOKUP = 3
+COMPLETE = 4
+REACTIVATE = 5
+EVENT_NAMES = {ASSIGN: "assign", UNASSIGN: "unassign", HOOKUP: "hookup", COMPLETE: "complete", REACTIVATE: "reactivate"}
+
+QUEUE_SIZE = 10000      # events buffered before new ones are dropped
+BATCH_SIZE = 500        # max events per insert transaction
+FLUSH_INTERVAL = 1.0    # seconds a partial batch waits before being written
+RETRY_DELAY = 0.5       # first backoff after a failed write, doubled up to RETRY_MAX_DELAY
+RETRY_MAX_DELAY = 30.0
+WRITE_ATTEMPTS = 5      # tries for errors other than a locked/busy DB
+LOCK_TIMEOUT = 30       # seconds sqlite waits on another writer before raising
+WRITER_THREAD_NAME = "event-log-writer"
+
+event_queue = queue.Queue(maxsize=QUEUE_SIZE)
+writer_lock = threading.Lock()
+writer_thread = None
+dropped = 0     # refused by record() because the queue was full
+lost = 0        # dequeued but could not be written
+
+
+def ensure_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS event_users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS assignment_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts INTEGER NOT NULL,
+            event INTEGER NOT NULL,
+            task_id INTEGER,
+            actor INTEGER,
+            from_user INTEGER,
+            to_user INTEGER,
+            score REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_assignment_events_ts ON assignment_events (ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_assignment_events_task ON assignment_events (task_id, ts)")
+    conn.commit()
+
+
+# Recording
+
+def record(event, task_id, actor, from_user=None, to_user=None, score=None):
+    # Never blocks the caller: if the writer has fallen this far behind the
+    # event is counted and dropped rather than stalling a rerun
+    global dropped
+    try:
+        event_queue.put_nowait((int(time.time() * 1000), event, int(task_id), actor, from_user, to_user, score))
+    except queue.Full:
+        dropped += 1
+        if dropped == 1 or dropped % QUEUE_SIZE == 0:
+            print(f"⚠️ Event log queue full; {dropped} assignment events dropped", file=sys.stderr)
+
+
+def stats():
+    return {"queued": event_queue.qsize(), "dropped": dropped, "lost": lost}
+
+
+def start_writer(db_path=None):
+    # Safe to call on every Streamlit rerun; only the first call starts a thread
+    global writer_thread
+    with writer_lock:
+        if writer_thread is None or not writer_thread.is_alive():
+            writer_thread = threading.Thread(
+                target=writer_loop, args=(db_path or DB_PATH,), name=WRITER_THREAD_NAME, daemon=True
+            )
+            writer_thread.start()
+
+
+def flush(timeout=5.0):
+    # Wait for queued events to hit the DB (tests, shutdown, replay tools)
+    deadline = time.monotonic() + timeout
+    while event_queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return event_queue.unfinished_tasks == 0
+
+
+def is_busy(error):
+    return isinstance(error, sqlite3.OperationalError) and any(
+        word in str(error).lower() for word in ("locked", "busy")
+    )
+
+
+def writer_loop(db_path):
+    global lost
+    conn = sqlite3.connect(db_path, timeout=LOCK_TIMEOUT)
+    delay = RETRY_DELAY
+    while True:
+        try:
+            ensure_schema(conn)
+            user_ids = dict(conn.execute("SELECT name, id FROM event_users"))
+            break
+        except sqlite3.OperationalError as e:
+            # Don't let a locked DB at startup kill the writer
+            if not is_busy(e):
+                raise
+            print(f"⚠️ Event log writer waiting for the DB ({e}); retrying in {delay:.1f}s", file=sys.stderr)
+            time.sleep(delay)
+            delay = min(delay * 2, RETRY_MAX_DELAY)
+
+    def user_id(name):
+        if name is None:
+            return None
+        name = str(name)
+        if name not in user_ids:
+            conn.execute("INSERT OR IGNORE INTO event_users (name) VALUES (?)", (name,))
+            user_ids[name] = conn.execute("SELECT id FROM event_users WHERE name = ?", (name,)).fetchone()[0]
+        return user_ids[name]
+
+    while True:
+        batch = [event_queue.get()]
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while len(batch) < BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(event_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        # Keep the batch and back off while the DB is locked; record() keeps
+        # the callers unblocked meanwhile. Anything else gets a few tries
+        # before the batch is counted as lost.
+        delay = RETRY_DELAY
+        attempts = 0
+        try:
+            while True:
+                try:
+                    with conn:
+                        rows = [
+                            (ts, event, task_id, user_id(actor), user_id(from_user), user_id(to_user), score)
+                            for ts, event, task_id, actor, from_user, to_user, score in batch
+                        ]
+                        conn.executemany(
+                            "INSERT INTO assignment_events (ts, event, task_id, actor, from_user, to_user, score) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            rows
+                        )
+                    break
+                except sqlite3.Error as e:
+                    # Names inserted in the failed transaction were rolled back
+                    # too; look them up again on the next attempt
+                    user_ids.clear()
+                    attempts += 1
+                    if not is_busy(e) and attempts >= WRITE_ATTEMPTS:
+                        lost += len(batch)
+                        print(f"❌ Lost {len(batch)} assignment events ({lost} in total): {e}", file=sys.stderr)
+                        break
+                    print(f"⚠️ Could not write {len(batch)} assignment events ({e}); retrying in {delay:.1f}s",
+                          file=sys.stderr)
+                    time.sleep(delay)
+                    delay = min(delay * 2, RETRY_MAX_DELAY)
+        finally:
+            for _ in batch:
+                event_queue.task_done()
+
+
+# Reading
+
+def to_ms(value):
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    return int(value)
+
+
+def events_between(conn, start, end, task_id=None):
+    # start/end are datetimes or epoch ms; end is exclusive
+    query = """
+        SELECT e.ts, e.event, e.task_id, a.name, f.name, t.name, e.score
+        FROM assignment_events e
+        LEFT JOIN event_users a ON a.id = e.actor
+        LEFT JOIN event_users f ON f.id = e.from_user
+        LEFT JOIN event_users t ON t.id = e.to_user
+        WHERE e.ts >= ? AND e.ts < ?
+    """
+    params = [to_ms(start), to_ms(end)]
+    if task_id is not None:
+        query += " AND e.task_id = ?"
+        params.append(task_id)
+    query += " ORDER BY e.ts, e.id"
+    return [
+        {
+            "ts": datetime.fromtimestamp(ts / 1000),
+            "event": EVENT_NAMES.get(event, str(event)),
+            "task_id": task,
+            "actor": actor,
+            "from_user": from_user,
+            "to_user": to_user,
+            "score": score,
+        }
+        for ts, event, task, actor, from_user, to_user, score in conn.execute(query, params)
+    ]
+
+
+def replay(events):
+    # Fold events into each task's final state: assignee, hooked up, complete
+    state = {}
+    for e in events:
+        task = state.setdefault(e["task_id"], {"assigned_to": None, "hooked_up": False, "complete": False, "moves": 0})
+        if e["event"] == "assign":
+            if task["assigned_to"] and task["assigned_to"] != e["to_user"]:
+                task["moves"] += 1
+            task["assigned_to"] = e["to_user"]
+        elif e["event"] == "unassign":
+            task["assigned_to"] = None
+            task["moves"] += 1
+        elif e["event"] == "hookup":
+            task["hooked_up"] = True
+        elif e["event"] == "complete":
+            task["complete"] = True
+        elif e["event"] == "reactivate":
+            task["complete"] = False
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dump or replay assignment events for a day")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--date", default=datetime.now().strftime("%Y-%m-%d"), help="YYYY-MM-DD")
+    parser.add_argument("--task", type=int)
+    parser.add_argument("--replay", action="store_true", help="print final per-task state instead of raw events")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    ensure_schema(conn)
+    start = datetime.strptime(args.date, "%Y-%m-%d")
+    events = events_between(conn, start, start + timedelta(days=1), task_id=args.task)
+
+    writer = csv.writer(sys.stdout)
+    if args.replay:
+        writer.writerow(["task_id", "assigned_to", "hooked_up", "complete", "moves"])
+        for task_id, task in sorted(replay(events).items()):
+            writer.writerow([task_id, task["assigned_to"], task["hooked_up"], task["complete"], task["moves"]])
+    else:
+        writer.writerow(["ts", "event", "task_id", "actor", "from_user", "to_user", "score"])
+        for e in events:
+            writer.writerow([e["ts"].isoformat(sep=" ", timespec="milliseconds"), e["event"], e["task_id"],
+                             e["actor"], e["from_user"], e["to_user"], e["score"]])
+
+
+if __name__ == "__main__":
+    main()
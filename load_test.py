@@ -0,0 +1,347 @@
+# Concurrent-session load test for streamlit_app.py.
+#
+# Seeds a throwaway flight_tasks.db, then runs each simulated session in its
+# own process (so CPU and query counts are per session) driving the app
+# through Streamlit's AppTest:
+#   - agents rerun user_dashboard every --refresh seconds
+#   - admins rerun admin_dashboard, importing flights and reassigning tasks
+#   - one background allocator thread re-scores unassigned tasks
+# and reports rerun latency percentiles, SQL statements per rerun,
+# "database is locked" counts and CPU per session. Reruns that raised are
+# kept out of the latency / statement / CPU figures and reported apart.
+#
+#   python load_test.py --agents 20 --admins 2 --duration 120
+#   python load_test.py --agents 40 --fail-p95-ms 1500 --json results.json
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(APP_DIR, "streamlit_app.py")
+AIRCRAFT_TYPES = ["B738", "A320", "A321", "B789", "A333", "DH8D"]
+
+
+# Seeding
+
+def seed_database(path, agents, flights, now=None):
+    # Only the schema production has: the app's tables plus what the
+    # schedule feed adds at startup. The app creates pins itself.
+    sys.path.insert(0, APP_DIR)
+    import schedule_feed
+
+    now = now or datetime.now()
+    conn = sqlite3.connect(path)
+    schedule_feed.ensure_schema(conn)
+
+    start = (now - timedelta(hours=2)).strftime("%H:%M")
+    finish = (now + timedelta(hours=6)).strftime("%H:%M")
+    conn.executemany("REPLACE INTO shifts (username, start, finish) VALUES (?, ?, ?)",
+                     [(a, start, finish) for a in agents])
+
+    rows = []
+    for i in range(flights):
+        std = now + timedelta(minutes=10 + i * 360 // max(flights, 1))
+        etd = std + timedelta(minutes=random.choice([0, 0, 0, 5, 10, 20]))
+        # A quarter start unassigned so the allocator has work to do
+        assigned = agents[i % len(agents)] if i % 4 else None
+        rows.append((f"LT{100 + i}", f"VH-{i:03d}", random.choice(AIRCRAFT_TYPES), "SYD",
+                     std.strftime("%H:%M"), etd.strftime("%H:%M"), assigned))
+    conn.executemany('''
+        INSERT INTO tasks (flight, aircraft, aircraft_type, destination, std, etd, assigned_to)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+    # Some history for the History tabs
+    done = now.isoformat()
+    conn.executemany('''
+        INSERT INTO tasks (flight, aircraft, aircraft_type, destination, std, etd, assigned_to, complete, completed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)
+    ''', [(f"LT{900 + i}", "VH-OLD", "B738", "MEL", "06:00", "06:00", agents[i % len(agents)], done)
+          for i in range(flights // 4)])
+    conn.commit()
+    conn.close()
+
+
+# Per-session instrumentation
+
+statement_count = 0
+
+
+def install_statement_counter():
+    # Every connection the app opens gets a trace callback; the event log's
+    # background writer is excluded since it is off the rerun path
+    from event_log import WRITER_THREAD_NAME
+    connect = sqlite3.connect
+
+    def count_statement(sql):
+        global statement_count
+        if threading.current_thread().name == WRITER_THREAD_NAME:
+            return
+        if sql.lstrip()[:6].upper() in ("BEGIN", "COMMIT", "ROLLBA"):
+            return
+        statement_count += 1
+
+    def counting_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.set_trace_callback(count_statement)
+        return conn
+
+    sqlite3.connect = counting_connect
+
+
+def is_locked(message):
+    return "database is locked" in str(message)
+
+
+def simulate_import(rng, imported):
+    # Same statements the Flights tab runs per workbook row; AppTest cannot
+    # drive st.file_uploader, so the admin session issues them directly
+    conn = sqlite3.connect("flight_tasks.db", timeout=5)
+    inserted = 0
+    try:
+        for i in range(rng.randint(5, 30)):
+            flight = f"IM{imported + i}"
+            std = (datetime.now() + timedelta(minutes=rng.randint(20, 300))).strftime("%H:%M")
+            if conn.execute("SELECT COUNT(*) FROM tasks WHERE flight = ? AND std = ?", (flight, std)).fetchone()[0] == 0:
+                conn.execute('''
+                    INSERT INTO tasks (flight, aircraft, aircraft_type, destination, std, etd)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (flight, "VH-IMP", rng.choice(AIRCRAFT_TYPES), "BNE", std, std))
+                inserted += 1
+        conn.commit()
+        return inserted, False
+    except sqlite3.OperationalError as e:
+        return 0, is_locked(e)
+    finally:
+        conn.close()
+
+
+def run_session(kind, username, workdir, args, seed, results):
+    # Always report back so the parent never waits on a dead session
+    try:
+        result = drive_session(kind, username, workdir, args, seed)
+    except Exception as e:
+        print(f"❌ {kind} session {username} failed: {e}", file=sys.stderr)
+        result = {"kind": kind, "user": username, "samples": [], "locked": 0, "errors": 1, "imported": 0, "cpu": 0.0, "wall": args.duration}
+    results.put(result)
+
+
+def drive_session(kind, username, workdir, args, seed):
+    os.chdir(workdir)
+    sys.path.insert(0, APP_DIR)
+    install_statement_counter()
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed)
+    at = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+    at.session_state["user"] = "admin" if kind == "admin" else username
+
+    samples = []
+    locked = 0
+    errors = 0
+    imported = 0
+    cpu_start = time.process_time()
+
+    # Stagger start so sessions do not rerun in lockstep
+    time.sleep(rng.uniform(0, args.refresh))
+    end = time.monotonic() + args.duration
+    while time.monotonic() < end:
+        tick = time.monotonic()
+        action = "refresh"
+
+        if kind == "admin" and rng.random() < args.admin_action_rate:
+            if rng.random() < 0.3:
+                count, was_locked = simulate_import(rng, imported)
+                imported += count
+                locked += was_locked
+                action = "import"
+            else:
+                boxes = [sb for sb in at.selectbox if str(sb.key or "").startswith("assign_")]
+                if boxes:
+                    box = rng.choice(boxes)
+                    box.set_value(rng.choice(box.options))
+                    action = "reassign"
+
+        before = statement_count
+        cpu_before = time.process_time()
+        started = time.perf_counter()
+        try:
+            at.run()
+            messages = [str(e.value) for e in at.exception]
+        except Exception as e:  # AppTest timeout or crash of the harness itself
+            messages = [f"{type(e).__name__}: {e}"]
+        elapsed = time.perf_counter() - started
+
+        locked += sum(1 for m in messages if is_locked(m))
+        errors += sum(1 for m in messages if not is_locked(m))
+        samples.append({
+            "action": action,
+            "latency": elapsed,
+            "statements": statement_count - before,
+            "cpu": time.process_time() - cpu_before,
+            "failed": bool(messages),
+        })
+
+        time.sleep(max(0.0, args.refresh - (time.monotonic() - tick)))
+
+    return {
+        "kind": kind,
+        "user": username,
+        "samples": samples,
+        "locked": locked,
+        "errors": errors,
+        "imported": imported,
+        "cpu": time.process_time() - cpu_start,
+        "wall": args.duration,
+    }
+
+
+# Background allocator
+
+def allocator_loop(workdir, interval, stop, totals):
+    sys.path.insert(0, APP_DIR)
+    import schedule_feed
+    import scoring_policy
+
+    db_path = os.path.join(workdir, "flight_tasks.db")
+    policy = scoring_policy.PolicyLoader(scoring_policy.config_path(db_path))
+    conn = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+    while not stop.wait(interval):
+        started = time.perf_counter()
+        try:
+            with conn:
+                task_ids = [r[0] for r in conn.execute(
+                    "SELECT id FROM tasks WHERE assigned_to IS NULL AND complete = 0 AND (hooked_up IS NULL OR hooked_up = 0)"
+                )]
+                users = [r[0] for r in conn.execute("SELECT username FROM shifts")]
+                schedule_feed.rescore(conn, task_ids, users, policy.current(), datetime.now())
+        except sqlite3.OperationalError as e:
+            totals["locked"] += is_locked(e)
+            totals["errors"] += not is_locked(e)
+        totals["cycles"] += 1
+        totals["latencies"].append(time.perf_counter() - started)
+
+
+# Reporting
+
+def summarize(sessions, allocator):
+    sys.path.insert(0, APP_DIR)
+    from schedule_feed import percentile
+
+    report = {}
+    for kind in ("agent", "admin"):
+        group = [s for s in sessions if s["kind"] == kind]
+        if not group:
+            continue
+        all_samples = [x for s in group for x in s["samples"]]
+        samples = [x for x in all_samples if not x["failed"]]
+        failed = [x["latency"] for x in all_samples if x["failed"]]
+        latencies = [x["latency"] for x in samples]
+        report[kind] = {
+            "sessions": len(group),
+            "reruns": len(samples),
+            "failed": len(failed),
+            "failed_p50_ms": round(percentile(failed, 50) * 1000, 1) if failed else None,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1) if samples else None,
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1) if samples else None,
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1) if samples else None,
+            "max_ms": round(max(latencies) * 1000, 1) if samples else None,
+            "statements_per_rerun": round(sum(x["statements"] for x in samples) / len(samples), 1) if samples else None,
+            "cpu_ms_per_rerun": round(sum(x["cpu"] for x in samples) / len(samples) * 1000, 1) if samples else None,
+            "cpu_pct_per_session": round(sum(s["cpu"] / s["wall"] for s in group) / len(group) * 100, 1),
+            "locked": sum(s["locked"] for s in group),
+            "errors": sum(s["errors"] for s in group),
+            "imported": sum(s["imported"] for s in group),
+            "actions": {a: sum(1 for x in all_samples if x["action"] == a) for a in ("refresh", "import", "reassign")},
+        }
+    latencies = allocator["latencies"]
+    report["allocator"] = {
+        "cycles": allocator["cycles"],
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+        "locked": allocator["locked"],
+        "errors": allocator["errors"],
+    }
+    return report
+
+
+def print_report(report):
+    columns = [("sessions", 4), ("reruns", 8), ("failed", 8), ("p50_ms", 9), ("p95_ms", 9), ("p99_ms", 9),
+               ("statements_per_rerun", 7), ("cpu_ms_per_rerun", 8), ("cpu_pct_per_session", 7),
+               ("locked", 8), ("errors", 8)]
+    headers = ["n", "ok", "failed", "p50 ms", "p95 ms", "p99 ms", "stmts", "cpu ms", "cpu %", "locked", "errors"]
+    print(f"{'':<10}" + "".join(f"{h:>{w}}" for h, (_, w) in zip(headers, columns)))
+    for kind in ("agent", "admin"):
+        if kind not in report:
+            continue
+        r = report[kind]
+        print(f"{kind:<10}" + "".join(f"{str(r[key]):>{w}}" for key, w in columns))
+    a = report["allocator"]
+    print(f"allocator: {a['cycles']} cycles, p95 {a['p95_ms']} ms, {a['locked']} locked, {a['errors']} errors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test streamlit_app.py with concurrent AppTest sessions")
+    parser.add_argument("--agents", type=int, default=10)
+    parser.add_argument("--admins", type=int, default=1)
+    parser.add_argument("--flights", type=int, default=150)
+    parser.add_argument("--duration", type=float, default=60, help="seconds each session runs")
+    parser.add_argument("--refresh", type=float, default=5, help="seconds between reruns (st_autorefresh interval)")
+    parser.add_argument("--admin-action-rate", type=float, default=0.3, help="chance an admin rerun imports or reassigns")
+    parser.add_argument("--allocate-every", type=float, default=15, help="seconds between allocator cycles")
+    parser.add_argument("--timeout", type=float, default=30, help="AppTest per-rerun timeout")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="keep the seeded DB here instead of a temp dir")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--fail-p95-ms", type=float, help="exit non-zero if agent p95 rerun latency exceeds this")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="pushback_load_")
+    os.makedirs(workdir, exist_ok=True)
+    agents = [f"agent{i:02d}" for i in range(max(args.agents, 1))]
+    seed_database(os.path.join(workdir, "flight_tasks.db"), agents, args.flights)
+    print(f"Seeded {args.flights} flights for {len(agents)} agents in {workdir}")
+
+    allocator = {"cycles": 0, "locked": 0, "errors": 0, "latencies": []}
+    stop = threading.Event()
+    alloc_thread = threading.Thread(target=allocator_loop, args=(workdir, args.allocate_every, stop, allocator), daemon=True)
+    alloc_thread.start()
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    sessions = [("agent", a) for a in agents[:args.agents]] + [("admin", "admin")] * args.admins
+    procs = [
+        ctx.Process(target=run_session, args=(kind, user, workdir, args, args.seed + i, results))
+        for i, (kind, user) in enumerate(sessions)
+    ]
+    for p in procs:
+        p.start()
+    collected = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    stop.set()
+    alloc_thread.join()
+
+    report = summarize(collected, allocator)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    agent_p95 = report.get("agent", {}).get("p95_ms")
+    if args.fail_p95_ms is not None and agent_p95 is not None and agent_p95 > args.fail_p95_ms:
+        print(f"❌ agent p95 {agent_p95} ms exceeds {args.fail_p95_ms} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
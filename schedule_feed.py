@@ -0,0 +1,578 @@
+# Schedule delta feed: stands in for the AODB feed until we have a real one.
+#
+# Run alongside the app:
+#   python schedule_feed.py --drop-dir feed_drop --http-port 8765 --socket-port 8766
+#
+# A delta is one JSON object, keyed the same way the workbook import dedupes
+# tasks (flight + STD):
+#   {"type": "new", "flight": "QF401", "std": "0930", "etd": "0945",
+#    "aircraft": "VH-XZA", "aircraft_type": "B738", "destination": "SYD"}
+#   {"type": "etd", "flight": "QF401", "std": "0930", "etd": "1005"}
+#   {"type": "cancel", "flight": "QF401", "std": "0930"}
+#
+# Deltas can be dropped as .json / .jsonl files into the drop directory,
+# POSTed to /deltas, or written one per line to the socket port.
+
+import argparse
+import json
+import os
+import queue
+import socketserver
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import event_log
+import scoring_policy
+from scoring_policy import parse_hhmm, parse_time
+
+DB_PATH = "flight_tasks.db"
+DELTA_TYPES = ("new", "etd", "cancel")
+
+# Queue / batching limits
+QUEUE_SIZE = 2000       # deltas held before sources are pushed back
+BATCH_SIZE = 200        # max deltas applied per transaction
+BATCH_WINDOW = 0.25     # seconds to let a burst settle before applying
+SUBMIT_TIMEOUT = 2.0    # seconds an HTTP client waits for queue space
+RETRY_DELAY = 0.5       # first wait before retrying a batch the DB refused
+RETRY_MAX_DELAY = 30.0  # cap on the retry backoff
+
+delta_queue = queue.Queue(maxsize=QUEUE_SIZE)
+policy_loader = None  # set in main() so a bad scoring config fails at startup
+stats_lock = threading.Lock()
+stats = {"received": 0, "rejected": 0, "applied": 0, "coalesced": 0, "unmatched": 0, "batches": 0,
+         "retries": 0, "failed": 0, "latencies": []}
+
+
+# DB Connection
+def get_connection():
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=10)
+    ensure_schema(conn)
+    return conn
+
+
+def ensure_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            flight TEXT,
+            aircraft TEXT,
+            aircraft_type TEXT,
+            destination TEXT,
+            std TEXT,
+            etd TEXT,
+            assigned_to TEXT,
+            complete INTEGER DEFAULT 0,
+            notes TEXT,
+            completed_at TEXT
+        )
+    """)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(tasks)")]
+    if "hooked_up" not in columns:
+        conn.execute("ALTER TABLE tasks ADD COLUMN hooked_up INTEGER DEFAULT 0")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS shifts (
+            username TEXT PRIMARY KEY,
+            start TEXT,
+            finish TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS delta_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER,
+            flight TEXT,
+            std TEXT,
+            kind TEXT,
+            received_at REAL,
+            applied_at REAL,
+            seen_at REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_delta_log_task ON delta_log (task_id, seen_at)")
+    conn.commit()
+
+
+def normalize_delta(raw):
+    if not isinstance(raw, dict):
+        raise ValueError(f"Delta must be a JSON object, got {type(raw).__name__}")
+    kind = str(raw.get("type", "")).strip().lower()
+    flight = str(raw.get("flight", "")).strip()
+    std = parse_hhmm(raw.get("std"))
+    if kind not in DELTA_TYPES:
+        raise ValueError(f"Unknown delta type: {raw.get('type')!r}")
+    if not flight or not std:
+        raise ValueError("Delta needs a flight and a valid STD")
+    delta = {"type": kind, "flight": flight, "std": std, "received_at": time.time()}
+    if kind != "cancel":
+        delta["etd"] = parse_hhmm(raw.get("etd"))
+        if delta["etd"] is None and (kind == "etd" or raw.get("etd") not in (None, "")):
+            raise ValueError(f"Invalid ETD: {raw.get('etd')!r}")
+    if kind == "new":
+        for field in ("aircraft", "aircraft_type", "destination"):
+            delta[field] = str(raw.get(field) or "").strip()
+    return delta
+
+
+# Queueing with backpressure
+
+def submit(raw, timeout=None):
+    enqueue([normalize_delta(raw)], timeout=timeout)
+
+
+def enqueue(deltas, timeout=None):
+    # Blocks while the queue is full; raises queue.Full once timeout expires.
+    # Deltas are idempotent, so a client retrying after a partial enqueue
+    # only repeats updates that are already applied.
+    for delta in deltas:
+        try:
+            delta_queue.put(delta, timeout=timeout)
+        except queue.Full:
+            with stats_lock:
+                stats["rejected"] += 1
+            raise
+        with stats_lock:
+            stats["received"] += 1
+
+
+def next_batch():
+    batch = [delta_queue.get()]
+    deadline = time.monotonic() + BATCH_WINDOW
+    while len(batch) < BATCH_SIZE:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(delta_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+def coalesce(batch):
+    # Collapse a burst down to one delta per flight, keeping the earliest
+    # receive time so latency is measured from the first update seen.
+    # A cancel wins over later ETD changes; only a later "new" revives it.
+    merged = {}
+    for delta in batch:
+        key = (delta["flight"], delta["std"])
+        prev = merged.get(key)
+        if prev is None or delta["type"] == "cancel" or (prev["type"] == "cancel" and delta["type"] == "new"):
+            combined = dict(delta)
+        elif prev["type"] == "cancel":
+            combined = dict(prev)
+        else:
+            combined = dict(prev)
+            combined.update({k: v for k, v in delta.items() if v not in (None, "")})
+            combined["type"] = "new" if "new" in (prev["type"], delta["type"]) else "etd"
+        combined["received_at"] = prev["received_at"] if prev else delta["received_at"]
+        merged[key] = combined
+    return list(merged.values())
+
+
+# Applying deltas
+
+def apply_batch(conn, deltas, policy, now=None):
+    now = now or datetime.now()
+    affected_tasks = set()
+    affected_users = set()
+    applied_at = time.time()
+    log_rows = []
+    events = []
+    unmatched = 0
+
+    with conn:
+        for delta in deltas:
+            # Dedupe on flight + STD whether or not the task is complete, as
+            # the workbook import does, preferring the open row if both exist
+            row = conn.execute(
+                "SELECT id, etd, assigned_to, hooked_up, complete FROM tasks WHERE flight = ? AND std = ? "
+                "ORDER BY complete LIMIT 1",
+                (delta["flight"], delta["std"])
+            ).fetchone()
+            completed = bool(row and row[4])
+            if completed:
+                row = None
+            task_id = row[0] if row else None
+            kind = delta["type"]
+
+            if row is None and (kind != "new" or completed):
+                # Nothing open to change: the flight already pushed back, was
+                # deleted, or never made it into the DB
+                print(f"⚠️ No open task for {delta['flight']} {delta['std']}; {kind} delta skipped", file=sys.stderr)
+                kind = "unmatched"
+                unmatched += 1
+            elif kind == "cancel":
+                conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+                if row[2]:
+                    affected_users.add(row[2])
+                    events.append((event_log.UNASSIGN, task_id, "feed", row[2], None, None))
+            elif row is None:
+                cursor = conn.execute('''
+                    INSERT INTO tasks (flight, aircraft, aircraft_type, destination, std, etd)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (delta["flight"], delta.get("aircraft"), delta.get("aircraft_type"),
+                      delta.get("destination"), delta["std"], delta.get("etd")))
+                task_id = cursor.lastrowid
+                affected_tasks.add(task_id)
+            elif delta.get("etd") and delta["etd"] != row[1]:
+                conn.execute("UPDATE tasks SET etd = ? WHERE id = ?", (delta["etd"], task_id))
+                if not row[3]:
+                    affected_tasks.add(task_id)
+                if row[2]:
+                    affected_users.add(row[2])
+
+            log_rows.append((task_id, delta["flight"], delta["std"], kind, delta["received_at"], applied_at))
+
+        conn.executemany(
+            "INSERT INTO delta_log (task_id, flight, std, kind, received_at, applied_at) VALUES (?, ?, ?, ?, ?, ?)",
+            log_rows
+        )
+        events.extend(rescore(conn, affected_tasks, affected_users, policy, now))
+
+    # Only log once the transaction has committed
+    for event in events:
+        event_log.record(*event)
+    if unmatched:
+        with stats_lock:
+            stats["unmatched"] += unmatched
+    return affected_tasks, affected_users
+
+
+def load_shifts(conn, today):
+    shifts = {}
+    for username, start, finish in conn.execute("SELECT username, start, finish FROM shifts"):
+        start_dt = parse_time(start, today)
+        end_dt = parse_time(finish, today)
+        if not (start_dt and end_dt):
+            continue
+        if end_dt <= start_dt:
+            end_dt += timedelta(days=1)  # overnight shift
+        shifts[username] = (start_dt, end_dt)
+    return shifts
+
+
+def load_queues(conn, today):
+    queues = {}
+    rows = conn.execute(
+        "SELECT id, assigned_to, aircraft_type, std, etd, hooked_up FROM tasks "
+        "WHERE assigned_to IS NOT NULL AND complete = 0"
+    ).fetchall()
+    for task_id, username, aircraft_type, std, etd, hooked_up in rows:
+        when = parse_time(etd, today) or parse_time(std, today)
+        queues.setdefault(username, []).append(
+            {"id": task_id, "time": when, "aircraft_type": aircraft_type, "hooked_up": hooked_up}
+        )
+    for user_tasks in queues.values():
+        user_tasks.sort(key=lambda t: t["time"] or datetime.max)
+    return queues
+
+
+def score_user(policy, task_time, aircraft_type, shift, user_tasks, now):
+    start, end = shift
+    if not policy.in_shift(task_time, start, end):
+        return None
+
+    last_task_time = now
+    last_type = None
+    for ut in user_tasks:
+        if ut["time"] and ut["time"] > last_task_time:
+            last_task_time = ut["time"]
+            last_type = ut["aircraft_type"]
+
+    return policy.score(task_time, aircraft_type, last_task_time, last_type, len(user_tasks))
+
+
+def rescore(conn, task_ids, usernames, policy, now):
+    # Only the tasks a delta touched and the queues of agents who held them
+    # are looked at; everyone else's queue is left alone. Returns the
+    # assignment events to log once the caller commits.
+    today = now.date()
+    events = []
+    shifts = load_shifts(conn, today)
+    queues = load_queues(conn, today)
+    task_ids = set(task_ids)
+
+    # Re-check the head of each affected queue, as reallocate_overdue does
+    for username in usernames:
+        user_tasks = queues.get(username, [])
+        if len(user_tasks) < 2 or user_tasks[0]["hooked_up"] or not user_tasks[0]["time"]:
+            continue
+        if policy.is_overdue(user_tasks[0]["time"], now):
+            task_ids.add(user_tasks[1]["id"])
+
+    if not task_ids:
+        return events
+
+    placeholders = ",".join("?" * len(task_ids))
+    tasks = conn.execute(
+        f"SELECT id, aircraft_type, std, etd, assigned_to, hooked_up FROM tasks "
+        f"WHERE id IN ({placeholders}) AND complete = 0 ORDER BY COALESCE(etd, std)",
+        tuple(task_ids)
+    ).fetchall()
+
+    for task_id, aircraft_type, std, etd, previous, hooked_up in tasks:
+        if hooked_up:
+            continue
+        task_time = parse_time(etd, today) or parse_time(std, today)
+        if not task_time:
+            continue
+
+        # Score against everyone else's queue without this task in it
+        if previous:
+            queues[previous] = [ut for ut in queues.get(previous, []) if ut["id"] != task_id]
+
+        best_user = None
+        best_score = -float('inf')
+        for username, shift in shifts.items():
+            score = score_user(policy, task_time, aircraft_type, shift, queues.get(username, []), now)
+            if score is None:
+                continue
+            # The current holder keeps the flight on a tie to avoid churn
+            if score > best_score or (score == best_score and username == previous):
+                best_score = score
+                best_user = username
+
+        if best_user != previous:
+            conn.execute("UPDATE tasks SET assigned_to = ? WHERE id = ?", (best_user, task_id))
+            if best_user:
+                events.append((event_log.ASSIGN, task_id, "feed", previous, best_user, best_score))
+            else:
+                events.append((event_log.UNASSIGN, task_id, "feed", previous, None, None))
+        if best_user:
+            queues.setdefault(best_user, []).append(
+                {"id": task_id, "time": task_time, "aircraft_type": aircraft_type, "hooked_up": 0}
+            )
+            queues[best_user].sort(key=lambda t: t["time"] or datetime.max)
+    return events
+
+
+def applier_loop():
+    conn = get_connection()
+    while True:
+        batch = next_batch()
+        deltas = coalesce(batch)
+        try:
+            applied = apply_with_retry(conn, deltas)
+        except Exception:
+            # A bug, not contention: keep the applier alive and say so loudly
+            print(f"❌ Dropped batch of {len(deltas)} deltas:", file=sys.stderr)
+            traceback.print_exc()
+            applied = False
+        finally:
+            for _ in batch:
+                delta_queue.task_done()
+        if not applied:
+            with stats_lock:
+                stats["failed"] += len(deltas)
+            continue
+        done = time.time()
+        with stats_lock:
+            stats["applied"] += len(deltas)
+            stats["coalesced"] += len(batch) - len(deltas)
+            stats["batches"] += 1
+            stats["latencies"].extend(done - d["received_at"] for d in deltas)
+            del stats["latencies"][:-5000]
+
+
+def is_busy(error):
+    return isinstance(error, sqlite3.OperationalError) and any(
+        word in str(error).lower() for word in ("locked", "busy")
+    )
+
+
+def apply_with_retry(conn, deltas):
+    # Lock timeouts while the app holds a write transaction are expected
+    # under load; keep the batch and back off rather than lose ETD updates.
+    # Meanwhile the queue fills and the sources get pushed back. Any other
+    # error is permanent and is raised for applier_loop to count and drop.
+    delay = RETRY_DELAY
+    while True:
+        try:
+            apply_batch(conn, deltas, policy_loader.current())
+            return True
+        except sqlite3.OperationalError as e:
+            if not is_busy(e):
+                raise
+            print(f"⚠️ Could not apply batch of {len(deltas)} ({e}); retrying in {delay:.1f}s", file=sys.stderr)
+            with stats_lock:
+                stats["retries"] += 1
+            time.sleep(delay)
+            delay = min(delay * 2, RETRY_MAX_DELAY)
+
+
+# Sources
+
+def read_delta_file(path):
+    with open(path) as f:
+        text = f.read().strip()
+    if not text:
+        return []
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def watch_drop_dir(drop_dir, poll_interval=0.5):
+    done_dir = os.path.join(drop_dir, "processed")
+    os.makedirs(done_dir, exist_ok=True)
+    while True:
+        for name in sorted(os.listdir(drop_dir)):
+            path = os.path.join(drop_dir, name)
+            if not name.endswith((".json", ".jsonl")) or not os.path.isfile(path):
+                continue
+            try:
+                records = read_delta_file(path)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Skipping {name}: {e}", file=sys.stderr)
+                os.replace(path, os.path.join(done_dir, name + ".bad"))
+                continue
+            for raw in records:
+                try:
+                    submit(raw)  # blocks while the queue is full
+                except ValueError as e:
+                    print(f"⚠️ {name}: {e}", file=sys.stderr)
+            os.replace(path, os.path.join(done_dir, name))
+        time.sleep(poll_interval)
+
+
+class DeltaHTTPHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path != "/deltas":
+            self.send_error(404)
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"[]")
+            records = body if isinstance(body, list) else [body]
+            # Reject the whole body before queueing any of it
+            deltas = [normalize_delta(raw) for raw in records]
+            enqueue(deltas, timeout=SUBMIT_TIMEOUT)
+        except queue.Full:
+            self.send_response(503)
+            self.send_header("Retry-After", "1")
+            self.end_headers()
+            return
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        self.send_response(202)
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path != "/stats":
+            self.send_error(404)
+            return
+        payload = json.dumps(stats_snapshot()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DeltaSocketHandler(socketserver.StreamRequestHandler):
+    # One JSON delta per line; a full queue stalls the read, which pushes
+    # back on the sender through TCP
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                submit(json.loads(line))
+                self.wfile.write(b"ok\n")
+            except ValueError as e:
+                self.wfile.write(f"error {e}\n".encode())
+
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+# Latency reporting
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def stats_snapshot():
+    with stats_lock:
+        snapshot = {k: v for k, v in stats.items() if k != "latencies"}
+        latencies = list(stats["latencies"])
+    snapshot["queued"] = delta_queue.qsize()
+    snapshot["event_log"] = event_log.stats()
+    for pct in (50, 95, 99):
+        value = percentile(latencies, pct)
+        snapshot[f"apply_p{pct}_ms"] = round(value * 1000, 1) if value is not None else None
+    return snapshot
+
+
+def latency_report(conn, since=None):
+    # Delta -> DB commit, and delta -> first agent screen that rendered it
+    since = since or 0
+    rows = conn.execute(
+        "SELECT received_at, applied_at, seen_at FROM delta_log WHERE received_at >= ?", (since,)
+    ).fetchall()
+    applied = [a - r for r, a, _ in rows if a]
+    seen = [s - r for r, _, s in rows if s]
+    report = {"deltas": len(rows), "seen": len(seen)}
+    for label, values in (("apply", applied), ("screen", seen)):
+        for pct in (50, 95, 99):
+            value = percentile(values, pct)
+            report[f"{label}_p{pct}_ms"] = round(value * 1000, 1) if value is not None else None
+    return report
+
+
+def main():
+    global DB_PATH, policy_loader
+    parser = argparse.ArgumentParser(description="Apply schedule deltas to the flight task DB")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--drop-dir", help="directory watched for .json/.jsonl delta files")
+    parser.add_argument("--http-port", type=int, help="port for POST /deltas and GET /stats")
+    parser.add_argument("--socket-port", type=int, help="port for line-delimited JSON deltas")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--report", action="store_true", help="print latency percentiles from delta_log and exit")
+    args = parser.parse_args()
+    DB_PATH = args.db
+
+    if args.report:
+        print(json.dumps(latency_report(get_connection()), indent=2))
+        return
+
+    if not (args.drop_dir or args.http_port or args.socket_port):
+        parser.error("need at least one of --drop-dir, --http-port, --socket-port")
+
+    policy_loader = scoring_policy.PolicyLoader(scoring_policy.config_path(DB_PATH))
+    event_log.start_writer(DB_PATH)
+    threading.Thread(target=applier_loop, daemon=True).start()
+    if args.drop_dir:
+        os.makedirs(args.drop_dir, exist_ok=True)
+        threading.Thread(target=watch_drop_dir, args=(args.drop_dir,), daemon=True).start()
+    if args.http_port:
+        http_server = ThreadingHTTPServer((args.host, args.http_port), DeltaHTTPHandler)
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    if args.socket_port:
+        socket_server = ThreadingTCPServer((args.host, args.socket_port), DeltaSocketHandler)
+        threading.Thread(target=socket_server.serve_forever, daemon=True).start()
+
+    print("✅ Schedule feed running")
+    try:
+        while True:
+            time.sleep(30)
+            print(json.dumps(stats_snapshot()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# Allocation scoring policy.
+#
+# Weights used to live inline in auto_allocate_tasks / reallocate_overdue.
+# They now come from scoring.json in the same directory as the DB (or the
+# file named by $PUSHBACK_SCORING_CONFIG), e.g.
+#   {"type_penalty": 10, "task_load_weight": 2,
+#    "shift_buffer_minutes": 15, "overdue_minutes": 15}
+# Missing keys keep the defaults below. A different scoring rule can be
+# plugged in by subclassing ScoringPolicy and naming it in the config:
+#   {"policy": "my_module.MyPolicy", "type_penalty": 5}
+#
+# Long-running callers hold a PolicyLoader: a broken config fails at
+# startup, and a broken edit later is logged while the last good policy
+# stays in use.
+
+import importlib
+import json
+import os
+import sys
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime, timedelta
+
+CONFIG_NAME = "scoring.json"
+# Errors a hand-edited config can raise from load_policy
+CONFIG_ERRORS = (OSError, ValueError, TypeError, ImportError, AttributeError)
+
+
+# Time parsing: workbook times are HHMM / HH:MM, allocator times are full datetimes
+
+def parse_hhmm(val):
+    if val is None or val == "":
+        return None
+    try:
+        val = int(val)
+    except (TypeError, ValueError):
+        pass
+    else:
+        hours, minutes = divmod(val, 100)
+        if 0 <= hours < 24 and minutes < 60:
+            return f"{hours:02d}:{minutes:02d}"
+        return None
+    try:
+        return datetime.strptime(str(val).strip(), "%H:%M").strftime("%H:%M")
+    except ValueError:
+        return None
+
+
+def parse_time(s, today):
+    if not s:
+        return None
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%H:%M"):
+        try:
+            parsed = datetime.strptime(s, fmt)
+        except (TypeError, ValueError):
+            continue
+        if fmt == "%H:%M":
+            parsed = datetime.combine(today, parsed.time())
+        return parsed
+    return None
+
+
+def config_path(db_path="flight_tasks.db"):
+    return os.environ.get("PUSHBACK_SCORING_CONFIG") or os.path.join(
+        os.path.dirname(os.path.abspath(db_path)), CONFIG_NAME
+    )
+
+
+@dataclass
+class ScoringPolicy:
+    type_penalty: float = 10           # score lost when switching aircraft type
+    task_load_weight: float = 2        # score lost per task already queued
+    shift_buffer_minutes: float = 15   # no tasks this close to shift start/end
+    overdue_minutes: float = 15        # release the next task when current is this close
+
+    def in_shift(self, task_time, start, end):
+        buffer = timedelta(minutes=self.shift_buffer_minutes)
+        return start + buffer <= task_time <= end - buffer
+
+    def score(self, task_time, aircraft_type, last_task_time, last_type, num_tasks):
+        # Higher is better: slack before the task, less switching and load
+        travel_time = (task_time - last_task_time).total_seconds() / 60
+        type_penalty = self.type_penalty if last_type and last_type != aircraft_type else 0
+        return travel_time - type_penalty - num_tasks * self.task_load_weight
+
+    def is_overdue(self, current_time, now):
+        return (current_time - now).total_seconds() / 60 < self.overdue_minutes
+
+    def weights(self):
+        return asdict(self)
+
+
+def build_policy(config):
+    config = dict(config)
+    policy_cls = ScoringPolicy
+    name = config.pop("policy", None)
+    if name:
+        module_name, _, cls_name = name.rpartition(".")
+        policy_cls = getattr(importlib.import_module(module_name), cls_name)
+        if not issubclass(policy_cls, ScoringPolicy):
+            raise ValueError(f"{name} is not a ScoringPolicy")
+    known = {f.name for f in fields(policy_cls)}
+    unknown = set(config) - known
+    if unknown:
+        raise ValueError(f"Unknown scoring weights: {', '.join(sorted(unknown))}")
+    return policy_cls(**{k: float(v) for k, v in config.items()})
+
+
+def load_policy(path=None):
+    path = path or config_path()
+    if not os.path.exists(path):
+        return ScoringPolicy()
+    with open(path) as f:
+        return build_policy(json.load(f))
+
+
+def save_policy(policy, path=None):
+    config = policy.weights()
+    if type(policy) is not ScoringPolicy:
+        config["policy"] = f"{type(policy).__module__}.{type(policy).__qualname__}"
+    with open(path or config_path(), "w") as f:
+        json.dump(config, f, indent=2)
+        f.write("\n")
+
+
+class PolicyLoader:
+    def __init__(self, path=None):
+        self.path = path or config_path()
+        self.mtime = self._mtime()
+        self.policy = load_policy(self.path)  # fail fast on a bad config
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def current(self):
+        # Re-read only when the file changes; keep the last good policy if
+        # the new contents don't load
+        mtime = self._mtime()
+        if mtime != self.mtime:
+            self.mtime = mtime
+            try:
+                self.policy = load_policy(self.path)
+            except CONFIG_ERRORS as e:
+                print(f"⚠️ Keeping previous scoring policy; {self.path} failed to load: {e}", file=sys.stderr)
+        return self.policy
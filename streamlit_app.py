@@ -5,6 +5,9 @@ from datetime import datetime
 import time
 from io import BytesIO
 from streamlit_autorefresh import st_autorefresh
+import event_log
+import schedule_feed
+import scoring_policy
 
 
 
@@ -52,6 +55,40 @@ def get_all_flights():
     return c.execute("SELECT * FROM tasks WHERE complete = 0 ORDER BY std").fetchall()
 
 
+def mark_deltas_seen(task_ids):
+    # Read first so the common no-op rerun never takes a write lock
+    if not task_ids:
+        return
+    placeholders = ",".join("?" * len(task_ids))
+    conn = get_connection()
+    pending = conn.execute(
+        f"SELECT id FROM delta_log WHERE seen_at IS NULL AND task_id IN ({placeholders})",
+        task_ids
+    ).fetchall()
+    if pending:
+        conn.executemany("UPDATE delta_log SET seen_at = ? WHERE id = ?", [(time.time(), row[0]) for row in pending])
+        conn.commit()
+    conn.close()
+
+
+UNASSIGNED = "Unassigned"
+
+
+def admin_reassign(task_id, previous):
+    choice = st.session_state[f"assign_{task_id}_{previous}"]
+    assigned = None if choice == UNASSIGNED else choice
+    if assigned == previous:
+        return
+    conn = get_connection()
+    conn.execute("UPDATE tasks SET assigned_to = ? WHERE id = ?", (assigned, task_id))
+    conn.commit()
+    conn.close()
+    if assigned:
+        event_log.record(event_log.ASSIGN, task_id, "admin", from_user=previous, to_user=assigned)
+    else:
+        event_log.record(event_log.UNASSIGN, task_id, "admin", from_user=previous)
+
+
 def display_flights(flights):
     for t in flights:
         st.markdown(
@@ -126,6 +163,13 @@ c.execute('''
 
 conn.commit()
 
+# hooked_up and the feed's delta_log (stamped when an agent screen first
+# shows a change) are defined once, in the schedule feed
+schedule_feed.ensure_schema(conn)
+
+# Assignment events are written off the request path by a background thread
+event_log.start_writer('flight_tasks.db')
+
 
 # Initialize PINs table with static users
 for user, pin in STATIC_USERS.items():
@@ -204,11 +248,18 @@ def parse_time(s):
     except:
         return None
 
+# Scoring weights: loaded once per server (a bad config fails here), then
+# re-read on change with the last good policy kept if an edit breaks it
+@st.cache_resource
+def get_policy_loader():
+    return scoring_policy.PolicyLoader(scoring_policy.config_path("flight_tasks.db"))
+
 # Auto assign flight tasks
 
 def auto_allocate_tasks():
     conn = get_connection()
     now = datetime.now()
+    policy = get_policy_loader().current()
     active_users = get_active_users()
     shifts = get_user_shifts()
     tasks = get_unassigned_tasks()
@@ -231,7 +282,7 @@ def auto_allocate_tasks():
             if not (start and end):
                 continue
 
-            if etd < start + timedelta(minutes=15) or etd > end - timedelta(minutes=15):
+            if not policy.in_shift(etd, start, end):
                 continue
 
             user_tasks = get_tasks_for_user(username)
@@ -244,10 +295,7 @@ def auto_allocate_tasks():
                     last_task_time = ut_time
                     last_type = ut['aircraft_type']
 
-            travel_time = (etd - last_task_time).total_seconds() / 60
-            type_penalty = 10 if last_type and last_type != task['aircraft_type'] else 0
-            num_user_tasks = len(user_tasks)
-            score = travel_time - type_penalty - num_user_tasks * 2
+            score = policy.score(etd, task['aircraft_type'], last_task_time, last_type, len(user_tasks))
 
             if score == best_score:
                 if random.choice([True, False]):
@@ -260,11 +308,13 @@ def auto_allocate_tasks():
         if best_user:
             conn.execute("UPDATE tasks SET assigned_to = ? WHERE id = ?", (best_user, task['id']))
             conn.commit()
+            event_log.record(event_log.ASSIGN, task['id'], "allocator", to_user=best_user, score=best_score)
 
 # Reallocate overdue tasks
 
 def reallocate_overdue():
     conn = get_connection()
+    policy = get_policy_loader().current()
     active_users = get_active_users()
     for username in active_users:
         tasks = get_tasks_for_user(username)
@@ -282,10 +332,11 @@ def reallocate_overdue():
             continue
 
         now = datetime.now()
-        travel_time = (etd - now).total_seconds() / 60
-        if travel_time < 15:
+        if policy.is_overdue(etd, now):
+            travel_time = (etd - now).total_seconds() / 60
             conn.execute("UPDATE tasks SET assigned_to = NULL WHERE id = ?", (next_task['id'],))
             conn.commit()
+            event_log.record(event_log.UNASSIGN, next_task['id'], "overdue", from_user=username, score=travel_time)
 
 # Auto refresh loop every 15 seconds
 if 'last_auto_refresh' not in st.session_state:
@@ -302,6 +353,10 @@ def admin_dashboard():
     st_autorefresh(interval=5 * 1000, key="user_auto_refresh")
 
     st.title("👨‍✈️ Admin Dashboard")
+    log_stats = event_log.stats()
+    if log_stats["dropped"] or log_stats["lost"]:
+        st.warning(f"⚠️ Assignment history is incomplete: {log_stats['dropped']} events dropped (queue full), "
+                   f"{log_stats['lost']} failed to write. See the app log.")
     tabs = st.tabs(["Users", "Shifts", "Flights", "History"])
 
     # USERS TAB
@@ -448,24 +503,29 @@ def admin_dashboard():
             st.success("✅ All tasks deleted.")
             st.session_state["task_refresh"] = time.time()
 
-        users = list(STATIC_USERS.keys())
+        users = [UNASSIGNED] + list(STATIC_USERS.keys())
         tasks = c.execute("SELECT * FROM tasks WHERE complete = 0 ORDER BY std").fetchall()
 
         for t in tasks:
             st.markdown(f"**{t[1]}** Aircraft: {t[2]} STD: {t[5]}")
             cols = st.columns([2, 1, 1])
-            assigned = cols[0].selectbox("Assign to", users, key=f"assign_{t[0]}", index=users.index(t[4]) if t[4] in users else 0)
+            # Keyed on the current assignee so allocator moves show up fresh,
+            # and only written when the admin actually changes it
+            cols[0].selectbox(
+                "Assign to", users, key=f"assign_{t[0]}_{t[7]}",
+                index=users.index(t[7]) if t[7] in users else 0,
+                on_change=admin_reassign, args=(t[0], t[7])
+            )
             if cols[1].button("Push Complete", key=f"complete_{t[0]}"):
                 completed_at = datetime.now().isoformat()
                 c.execute("UPDATE tasks SET complete = 1, completed_at = ? WHERE id = ?", (completed_at, t[0]))
                 conn.commit()
+                event_log.record(event_log.COMPLETE, t[0], "admin", from_user=t[7])
                 st.rerun()
             if cols[2].button("Delete", key=f"delete_{t[0]}"):
                 c.execute("DELETE FROM tasks WHERE id = ?", (t[0],))
                 conn.commit()
                 st.rerun()
-            c.execute("UPDATE tasks SET assigned_to = ? WHERE id = ?", (assigned, t[0]))
-        conn.commit()
 
         st.button("🔄 Refresh Flights", on_click=refresh_data)
 
@@ -483,6 +543,7 @@ def admin_dashboard():
                 if st.button("Hooked up to Aircraft", key=f"hooked_{task_id}"):
                     conn.execute("UPDATE tasks SET hooked_up = 1 WHERE id = ?", (task_id,))
                     conn.commit()
+                    event_log.record(event_log.HOOKUP, task_id, "admin", to_user=row[7])
         conn.close()
 
     # HISTORY TAB
@@ -499,6 +560,7 @@ def admin_dashboard():
             if col2.button("Mark Incomplete", key=f"undo_{t[0]}"):
                 c.execute("UPDATE tasks SET complete = 0, completed_at = NULL WHERE id = ?", (t[0],))
                 conn.commit()
+                event_log.record(event_log.REACTIVATE, t[0], "admin")
                 st.rerun()
 
         st.button("🔄 Refresh History", on_click=refresh_data)
@@ -561,13 +623,14 @@ def user_dashboard(username):
         st.button("🔄 Refresh My Tasks", on_click=refresh_data)
 
         tasks = c.execute(
-            "SELECT id, flight, aircraft, std FROM tasks WHERE assigned_to = ? AND complete = 0 ORDER BY std",
+            "SELECT id, flight, aircraft, std, etd FROM tasks WHERE assigned_to = ? AND complete = 0 ORDER BY COALESCE(etd, std)",
             (username,)
         ).fetchall()
+        mark_deltas_seen([t[0] for t in tasks])
 
         if tasks:
             current = tasks[0]
-            color = get_status_color(current[3])
+            color = get_status_color(current[4] or current[3])
             st.markdown("### 🟢 **Current Task**")
             with st.container():
                 st.markdown(
@@ -576,6 +639,7 @@ def user_dashboard(username):
                         <h2 style='margin-bottom: 10px;'>✈️ {current[1]}</h2>
                         <p><strong>Aircraft:</strong> {current[2]}</p>
                         <p><strong>STD:</strong> {current[3]}</p>
+                        <p><strong>ETD:</strong> {current[4] or current[3]}</p>
                     </div>
                     """,
                     unsafe_allow_html=True
@@ -584,11 +648,12 @@ def user_dashboard(username):
                     completed_at = datetime.now().isoformat()
                     c.execute("UPDATE tasks SET complete = 1, completed_at = ? WHERE id = ?", (completed_at, current[0]))
                     conn.commit()
+                    event_log.record(event_log.COMPLETE, current[0], username, from_user=username)
                     st.rerun()
 
             if len(tasks) > 1:
                 next_task = tasks[1]
-                color = get_status_color(next_task[3])
+                color = get_status_color(next_task[4] or next_task[3])
                 st.markdown("### 🟡 **Next Task**")
                 with st.container():
                     st.markdown(
@@ -597,6 +662,7 @@ def user_dashboard(username):
                             <h3 style='margin-bottom: 10px;'>✈️ {next_task[1]}</h3>
                             <p><strong>Aircraft:</strong> {next_task[2]}</p>
                             <p><strong>STD:</strong> {next_task[3]}</p>
+                            <p><strong>ETD:</strong> {next_task[4] or next_task[3]}</p>
                         </div>
                         """,
                         unsafe_allow_html=True
@@ -608,11 +674,12 @@ def user_dashboard(username):
             with st.expander("📋 View Future Tasks"):
                 for t in tasks[2:]:
                     col1, col2 = st.columns([4, 1])
-                    col1.markdown(f"**{t[1]}** | Aircraft: {t[2]} | STD: {t[3]}")
+                    col1.markdown(f"**{t[1]}** | Aircraft: {t[2]} | STD: {t[3]} | ETD: {t[4] or t[3]}")
                     if col2.button("Complete", key=f"user_complete_future_{t[0]}"):
                         completed_at = datetime.now().isoformat()
                         c.execute("UPDATE tasks SET complete = 1, completed_at = ? WHERE id = ?", (completed_at, t[0]))
                         conn.commit()
+                        event_log.record(event_log.COMPLETE, t[0], username, from_user=username)
                         st.rerun()
 
     with tabs[1]:
@@ -629,6 +696,7 @@ def user_dashboard(username):
             if col2.button("🔁 Reactivate", key=f"reactivate_{t[0]}"):
                 c.execute("UPDATE tasks SET complete = 0, completed_at = NULL WHERE id = ?", (t[0],))
                 conn.commit()
+                event_log.record(event_log.REACTIVATE, t[0], username, to_user=username)
                 st.rerun()
 
 
@@ -0,0 +1,107 @@
+import queue
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import event_log
+
+
+def event(kind, task_id, actor="allocator", from_user=None, to_user=None):
+    return {"ts": datetime(2026, 10, 19, 9, 0), "event": kind, "task_id": task_id,
+            "actor": actor, "from_user": from_user, "to_user": to_user, "score": None}
+
+
+def test_replay_tracks_final_assignee_and_moves():
+    state = event_log.replay([
+        event("assign", 1, to_user="a.elliott"),
+        event("unassign", 1, actor="overdue", from_user="a.elliott"),
+        event("assign", 1, to_user="s.chianta"),
+        event("assign", 1, actor="admin", from_user="s.chianta", to_user="d.jeffery"),
+        event("hookup", 1, actor="admin", to_user="d.jeffery"),
+        event("complete", 1, actor="d.jeffery", from_user="d.jeffery"),
+    ])
+    assert state[1] == {"assigned_to": "d.jeffery", "hooked_up": True, "complete": True, "moves": 2}
+
+
+def test_replay_reactivate_and_same_agent_reassign():
+    state = event_log.replay([
+        event("assign", 2, to_user="a.elliott"),
+        event("assign", 2, to_user="a.elliott"),
+        event("complete", 2, actor="a.elliott"),
+        event("reactivate", 2, actor="a.elliott", to_user="a.elliott"),
+    ])
+    assert state[2] == {"assigned_to": "a.elliott", "hooked_up": False, "complete": False, "moves": 0}
+
+
+@pytest.fixture
+def writer(tmp_path, monkeypatch):
+    path = str(tmp_path / "flight_tasks.db")
+    monkeypatch.setattr(event_log, "event_queue", queue.Queue(maxsize=event_log.QUEUE_SIZE))
+    monkeypatch.setattr(event_log, "writer_thread", None)
+    monkeypatch.setattr(event_log, "FLUSH_INTERVAL", 0.05)
+    event_log.start_writer(path)
+    return path
+
+
+def test_writer_batches_events_and_range_query_decodes(writer):
+    start = datetime.now() - timedelta(seconds=1)
+    event_log.record(event_log.ASSIGN, 7, "allocator", to_user="a.elliott", score=12.5)
+    event_log.record(event_log.UNASSIGN, 7, "overdue", from_user="a.elliott")
+    event_log.record(event_log.HOOKUP, 8, "admin", to_user="s.chianta")
+    assert event_log.flush()
+
+    conn = sqlite3.connect(writer)
+    rows = event_log.events_between(conn, start, datetime.now() + timedelta(seconds=1))
+    assert [(r["event"], r["task_id"], r["actor"], r["from_user"], r["to_user"], r["score"]) for r in rows] == [
+        ("assign", 7, "allocator", None, "a.elliott", 12.5),
+        ("unassign", 7, "overdue", "a.elliott", None, None),
+        ("hookup", 8, "admin", None, "s.chianta", None),
+    ]
+    assert len(event_log.events_between(conn, start, datetime.now() + timedelta(seconds=1), task_id=8)) == 1
+    assert event_log.events_between(conn, start - timedelta(hours=1), start) == []
+    # Names are stored once and referenced by id
+    assert conn.execute("SELECT COUNT(*) FROM event_users").fetchone()[0] == 5
+
+
+def test_record_drops_instead_of_blocking_when_full(monkeypatch):
+    monkeypatch.setattr(event_log, "event_queue", queue.Queue(maxsize=1))
+    monkeypatch.setattr(event_log, "dropped", 0)
+    event_log.record(event_log.COMPLETE, 1, "a.elliott")
+    event_log.record(event_log.COMPLETE, 2, "a.elliott")
+    assert event_log.dropped == 1
+
+
+@pytest.fixture
+def fast_retry(monkeypatch):
+    monkeypatch.setattr(event_log, "RETRY_DELAY", 0.01)
+    monkeypatch.setattr(event_log, "LOCK_TIMEOUT", 0.01)
+    monkeypatch.setattr(event_log, "lost", 0)
+
+
+def test_writer_keeps_batch_while_locked(fast_retry, writer):
+    event_log.record(event_log.ASSIGN, 8, "allocator", to_user="s.chianta")
+    assert event_log.flush()
+    blocker = sqlite3.connect(writer)
+    blocker.execute("BEGIN EXCLUSIVE")
+    start = datetime.now() - timedelta(seconds=1)
+    event_log.record(event_log.ASSIGN, 9, "allocator", to_user="a.elliott")
+    assert not event_log.flush(timeout=0.3)
+    blocker.rollback()
+
+    assert event_log.flush()
+    rows = event_log.events_between(blocker, start, datetime.now() + timedelta(seconds=1))
+    assert [(r["task_id"], r["to_user"]) for r in rows] == [(8, "s.chianta"), (9, "a.elliott")]
+    assert event_log.lost == 0
+
+
+def test_writer_counts_lost_events_after_permanent_errors(fast_retry, writer, monkeypatch):
+    monkeypatch.setattr(event_log, "WRITE_ATTEMPTS", 2)
+    event_log.record(event_log.HOOKUP, 1, "admin")
+    assert event_log.flush()
+    sqlite3.connect(writer).execute("DROP TABLE assignment_events")
+
+    event_log.record(event_log.COMPLETE, 1, "a.elliott")
+    event_log.record(event_log.COMPLETE, 2, "a.elliott")
+    assert event_log.flush()
+    assert event_log.stats()["lost"] == 2
@@ -0,0 +1,244 @@
+from datetime import datetime
+
+import pytest
+
+import event_log
+import schedule_feed as sf
+from scoring_policy import ScoringPolicy
+
+NOW = datetime(2026, 10, 19, 9, 0)
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(sf, "DB_PATH", str(tmp_path / "flight_tasks.db"))
+    conn = sf.get_connection()
+    conn.executemany("INSERT INTO shifts (username, start, finish) VALUES (?, ?, ?)",
+                     [("a.elliott", "06:00", "14:00"), ("s.chianta", "06:00", "14:00")])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def events(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(event_log, "record", lambda *args: recorded.append(args))
+    return recorded
+
+
+def delta(**raw):
+    return sf.normalize_delta(raw)
+
+
+def apply(conn, *raws):
+    return sf.apply_batch(conn, sf.coalesce([delta(**r) for r in raws]), ScoringPolicy(), now=NOW)
+
+
+def tasks(conn):
+    return conn.execute("SELECT flight, std, etd, assigned_to, complete, aircraft FROM tasks ORDER BY id").fetchall()
+
+
+# normalize_delta
+
+@pytest.mark.parametrize("raw", [[1], 5, "x", None])
+def test_normalize_rejects_non_objects(raw):
+    with pytest.raises(ValueError):
+        sf.normalize_delta(raw)
+
+
+def test_normalize_rejects_unknown_type_and_missing_std():
+    with pytest.raises(ValueError):
+        delta(type="divert", flight="QF1", std="0930")
+    with pytest.raises(ValueError):
+        delta(type="etd", flight="QF1", etd="0940")
+
+
+def test_normalize_converts_workbook_times():
+    d = delta(type="new", flight=" QF1 ", std=930, etd="0945", aircraft_type="B738")
+    assert (d["flight"], d["std"], d["etd"], d["aircraft_type"]) == ("QF1", "09:30", "09:45", "B738")
+
+
+@pytest.mark.parametrize("etd", [None, "", "garbage", "2599", 2460, "24:00", "09:75"])
+def test_normalize_rejects_bad_etd(etd):
+    with pytest.raises(ValueError):
+        delta(type="etd", flight="QF1", std="0930", etd=etd)
+
+
+def test_normalize_allows_new_without_etd_but_not_a_bad_one():
+    assert delta(type="new", flight="QF1", std="0930")["etd"] is None
+    with pytest.raises(ValueError):
+        delta(type="new", flight="QF1", std="0930", etd="2599")
+
+
+# coalesce
+
+def test_coalesce_merges_etd_updates_into_one():
+    batch = [delta(type="etd", flight="QF1", std="0930", etd=t) for t in ("0940", "0950", "1005")]
+    (merged,) = sf.coalesce(batch)
+    assert merged["etd"] == "10:05"
+    assert merged["received_at"] == batch[0]["received_at"]
+
+
+def test_coalesce_cancel_wins_over_later_etd():
+    (merged,) = sf.coalesce([
+        delta(type="cancel", flight="QF1", std="0930"),
+        delta(type="etd", flight="QF1", std="0930", etd="0950"),
+    ])
+    assert merged["type"] == "cancel"
+
+
+def test_coalesce_new_after_cancel_reinstates():
+    (merged,) = sf.coalesce([
+        delta(type="cancel", flight="QF1", std="0930"),
+        delta(type="new", flight="QF1", std="0930", etd="0950", aircraft_type="A320"),
+    ])
+    assert merged["type"] == "new"
+    assert merged["aircraft_type"] == "A320"
+
+
+def test_coalesce_keeps_new_when_etd_follows():
+    (merged,) = sf.coalesce([
+        delta(type="new", flight="QF1", std="0930", aircraft_type="A320"),
+        delta(type="etd", flight="QF1", std="0930", etd="0950"),
+    ])
+    assert (merged["type"], merged["etd"], merged["aircraft_type"]) == ("new", "09:50", "A320")
+
+
+def test_coalesce_keeps_flights_apart():
+    merged = sf.coalesce([
+        delta(type="etd", flight="QF1", std="0930", etd="0950"),
+        delta(type="etd", flight="QF1", std="1430", etd="1450"),
+        delta(type="etd", flight="QF2", std="0930", etd="0955"),
+    ])
+    assert len(merged) == 3
+
+
+# apply_batch / rescore
+
+def test_new_flights_are_inserted_and_allocated(conn, events):
+    affected, _ = apply(conn,
+                        {"type": "new", "flight": "QF1", "std": "0930", "aircraft_type": "B738"},
+                        {"type": "new", "flight": "QF2", "std": "0945", "aircraft_type": "B738"})
+    assert len(affected) == 2
+    assigned = [row[3] for row in tasks(conn)]
+    assert None not in assigned
+    assert [e[0] for e in events] == [event_log.ASSIGN, event_log.ASSIGN]
+
+
+def test_etd_for_completed_flight_is_skipped(conn, events):
+    conn.execute("INSERT INTO tasks (flight, aircraft, std, etd, complete) VALUES ('QF1', 'VH-XZA', '09:30', '09:30', 1)")
+    conn.commit()
+    apply(conn, {"type": "etd", "flight": "QF1", "std": "0930", "etd": "0950"})
+    assert tasks(conn) == [("QF1", "09:30", "09:30", None, 1, "VH-XZA")]
+    assert conn.execute("SELECT kind, task_id FROM delta_log").fetchall() == [("unmatched", None)]
+
+
+def test_new_for_completed_flight_is_not_duplicated(conn, events):
+    conn.execute("INSERT INTO tasks (flight, aircraft, std, etd, complete) VALUES ('QF1', 'VH-XZA', '09:30', '09:30', 1)")
+    conn.commit()
+    affected, _ = apply(conn, {"type": "new", "flight": "QF1", "std": "0930", "aircraft_type": "B738"})
+    assert not affected
+    assert tasks(conn) == [("QF1", "09:30", "09:30", None, 1, "VH-XZA")]
+    assert conn.execute("SELECT kind, task_id FROM delta_log").fetchall() == [("unmatched", None)]
+    assert events == []
+
+
+def test_cancel_removes_open_task_and_logs_unassign(conn, events):
+    apply(conn, {"type": "new", "flight": "QF1", "std": "0930", "aircraft_type": "B738"})
+    holder = tasks(conn)[0][3]
+    events.clear()
+    apply(conn, {"type": "cancel", "flight": "QF1", "std": "0930"})
+    assert tasks(conn) == []
+    assert events == [(event_log.UNASSIGN, 1, "feed", holder, None, None)]
+
+
+def test_cancel_then_etd_in_one_batch_still_cancels(conn, events):
+    apply(conn, {"type": "new", "flight": "QF1", "std": "0930", "aircraft_type": "B738"})
+    apply(conn,
+          {"type": "cancel", "flight": "QF1", "std": "0930"},
+          {"type": "etd", "flight": "QF1", "std": "0930", "etd": "0950"})
+    assert tasks(conn) == []
+
+
+def test_etd_outside_shift_unassigns(conn, events):
+    apply(conn, {"type": "new", "flight": "QF1", "std": "1300", "aircraft_type": "B738"})
+    assert tasks(conn)[0][3] is not None
+    apply(conn, {"type": "etd", "flight": "QF1", "std": "1300", "etd": "1355"})
+    assert tasks(conn)[0][2:4] == ("13:55", None)
+    assert events[-1][0] == event_log.UNASSIGN
+
+
+def test_hooked_up_task_is_not_moved(conn, events):
+    conn.execute("INSERT INTO tasks (flight, aircraft_type, std, etd, assigned_to, hooked_up) "
+                 "VALUES ('QF1', 'B738', '13:00', '13:00', 'a.elliott', 1)")
+    conn.commit()
+    apply(conn, {"type": "etd", "flight": "QF1", "std": "1300", "etd": "1355"})
+    assert tasks(conn)[0][2:4] == ("13:55", "a.elliott")
+    assert events == []
+
+
+def test_rescore_leaves_unaffected_queues_alone(conn, events):
+    conn.execute("INSERT INTO tasks (flight, aircraft_type, std, etd, assigned_to) "
+                 "VALUES ('QF9', 'B738', '11:00', '11:00', 's.chianta')")
+    conn.commit()
+    apply(conn, {"type": "new", "flight": "QF1", "std": "1000", "aircraft_type": "B738"})
+    assert ("QF9", "11:00", "11:00", "s.chianta", 0, None) in tasks(conn)
+
+
+def test_rescore_releases_next_task_when_current_is_close(conn, events):
+    conn.executemany("INSERT INTO tasks (flight, aircraft_type, std, etd, assigned_to) VALUES (?, 'B738', ?, ?, 'a.elliott')",
+                     [("QF1", "09:05", "09:05"), ("QF2", "11:00", "11:00")])
+    conn.commit()
+    sf.rescore(conn, set(), {"a.elliott"}, ScoringPolicy(), NOW)
+    assert dict((row[0], row[3]) for row in tasks(conn)) == {"QF1": "a.elliott", "QF2": "s.chianta"}
+
+
+def test_locked_database_is_retried(conn, monkeypatch):
+    calls = []
+
+    def flaky(conn, deltas, policy):
+        calls.append(len(deltas))
+        if len(calls) < 3:
+            raise sf.sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(sf, "apply_batch", flaky)
+    monkeypatch.setattr(sf, "RETRY_DELAY", 0)
+    monkeypatch.setattr(sf, "policy_loader", type("Loader", (), {"current": lambda self: ScoringPolicy()})())
+    assert sf.apply_with_retry(conn, [delta(type="etd", flight="QF1", std="0930", etd="0950")])
+    assert calls == [1, 1, 1]
+
+
+def test_permanent_errors_are_not_retried(conn, monkeypatch):
+    calls = []
+
+    def broken(conn, deltas, policy):
+        calls.append(len(deltas))
+        raise sf.sqlite3.OperationalError("no such column: etd")
+
+    monkeypatch.setattr(sf, "apply_batch", broken)
+    monkeypatch.setattr(sf, "policy_loader", type("Loader", (), {"current": lambda self: ScoringPolicy()})())
+    with pytest.raises(sf.sqlite3.OperationalError):
+        sf.apply_with_retry(conn, [delta(type="etd", flight="QF1", std="0930", etd="0950")])
+    assert calls == [1]
+
+
+def test_http_rejects_whole_body_before_queueing(monkeypatch):
+    import json
+    import queue
+    import threading
+    import urllib.error
+    import urllib.request
+
+    monkeypatch.setattr(sf, "delta_queue", queue.Queue(maxsize=10))
+    server = sf.ThreadingHTTPServer(("127.0.0.1", 0), sf.DeltaHTTPHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        body = json.dumps([{"type": "etd", "flight": "QF1", "std": "0930", "etd": "0950"}, [1]]).encode()
+        request = urllib.request.Request(f"http://127.0.0.1:{server.server_port}/deltas", data=body, method="POST")
+        with pytest.raises(urllib.error.HTTPError) as exc:
+            urllib.request.urlopen(request)
+        assert exc.value.code == 400
+        assert sf.delta_queue.qsize() == 0
+    finally:
+        server.shutdown()
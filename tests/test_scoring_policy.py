@@ -0,0 +1,68 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+import scoring_policy
+from scoring_policy import PolicyLoader, ScoringPolicy
+
+NINE = datetime(2026, 10, 19, 9, 0)
+
+
+def test_defaults_match_previous_inline_weights():
+    policy = ScoringPolicy()
+    # 30 min slack, type change, 3 queued tasks: 30 - 10 - 3 * 2
+    assert policy.score(datetime(2026, 10, 19, 9, 30), "A320", NINE, "B738", 3) == 14
+    assert policy.in_shift(datetime(2026, 10, 19, 9, 15), NINE, datetime(2026, 10, 19, 17, 0))
+    assert not policy.in_shift(datetime(2026, 10, 19, 9, 14), NINE, datetime(2026, 10, 19, 17, 0))
+    assert policy.is_overdue(datetime(2026, 10, 19, 9, 14), NINE)
+    assert not policy.is_overdue(datetime(2026, 10, 19, 9, 15), NINE)
+
+
+def test_time_parsing_shared_by_feed_and_tuner():
+    assert scoring_policy.parse_hhmm(930) == "09:30"
+    assert scoring_policy.parse_hhmm(" 23:59 ") == "23:59"
+    assert scoring_policy.parse_hhmm("2599") is None
+    assert scoring_policy.parse_time("09:30", NINE.date()) == datetime(2026, 10, 19, 9, 30)
+    assert scoring_policy.parse_time("2026-10-18 23:50:00", NINE.date()) == datetime(2026, 10, 18, 23, 50)
+    assert scoring_policy.parse_time("nonsense", NINE.date()) is None
+
+
+def test_build_policy_rejects_unknown_weights():
+    with pytest.raises(ValueError):
+        scoring_policy.build_policy({"typo": 1})
+
+
+def test_config_path_sits_beside_db(tmp_path, monkeypatch):
+    monkeypatch.delenv("PUSHBACK_SCORING_CONFIG", raising=False)
+    db = tmp_path / "elsewhere" / "flight_tasks.db"
+    assert scoring_policy.config_path(str(db)) == str(tmp_path / "elsewhere" / "scoring.json")
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "scoring.json")
+    scoring_policy.save_policy(ScoringPolicy(type_penalty=4, overdue_minutes=9), path)
+    assert scoring_policy.load_policy(path) == ScoringPolicy(type_penalty=4, overdue_minutes=9)
+
+
+def test_loader_fails_fast_on_bad_config(tmp_path):
+    path = tmp_path / "scoring.json"
+    path.write_text(json.dumps({"typo": 1}))
+    with pytest.raises(ValueError):
+        PolicyLoader(str(path))
+
+
+def test_loader_keeps_last_good_policy_on_bad_reload(tmp_path):
+    path = tmp_path / "scoring.json"
+    path.write_text(json.dumps({"type_penalty": 3}))
+    loader = PolicyLoader(str(path))
+    assert loader.current().type_penalty == 3
+
+    path.write_text("{not json")
+    os.utime(path, ns=(1, 1))
+    assert loader.current().type_penalty == 3
+
+    path.write_text(json.dumps({"type_penalty": 7}))
+    os.utime(path, ns=(2, 2))
+    assert loader.current().type_penalty == 7
@@ -0,0 +1,57 @@
+import random
+from datetime import datetime, timedelta
+
+import tune_scoring
+from scoring_policy import ScoringPolicy
+
+DAY = datetime(2026, 10, 19)
+
+
+def at(hour, minute=0):
+    return DAY + timedelta(hours=hour, minutes=minute)
+
+
+def day(tasks, agents):
+    return {
+        "date": DAY.date(),
+        "tasks": [{"id": i, "time": t, "aircraft_type": kind, "agent": None} for i, (t, kind) in enumerate(tasks)],
+        "agents": agents,
+    }
+
+
+def test_well_spaced_day_has_no_late_pushbacks():
+    d = day([(at(9, 15 * i), "B738") for i in range(8)], {"a": (at(6), at(14)), "b": (at(6), at(14))})
+    result = tune_scoring.simulate_day(ScoringPolicy(), d)
+    assert result == {"late": 0, "late_minutes": 0.0, "reassignments": 0, "unallocated": 0}
+
+
+def test_flights_outside_every_shift_count_as_late():
+    d = day([(at(9), "B738"), (at(20), "B738")], {"a": (at(6), at(14))})
+    result = tune_scoring.simulate_day(ScoringPolicy(), d)
+    assert result["unallocated"] == 1
+    assert result["late"] == 1
+
+
+def test_overloaded_agent_is_late():
+    # One agent, three pushbacks a minute apart: at least two must be late
+    d = day([(at(9, i), "B738") for i in range(3)], {"a": (at(6), at(14))})
+    result = tune_scoring.simulate_day(ScoringPolicy(), d, service=8, transit=5)
+    assert result["late"] >= 2
+    assert result["late_minutes"] > 0
+
+
+def test_pushback_never_precedes_assignment():
+    # Flights released by the overdue step and reallocated must not be
+    # pushed back before (or within transit of) being handed over
+    rng = random.Random(3)
+    policy = ScoringPolicy(overdue_minutes=25)
+    reassigned = 0
+    for _ in range(30):
+        tasks = sorted((at(8, rng.randint(0, 240)), rng.choice(["B738", "A320"])) for _ in range(25))
+        agents = {name: (at(rng.randint(6, 9)), at(14)) for name in "abc"}
+        trace = []
+        result = tune_scoring.simulate_day(policy, day(tasks, agents), transit=5, trace=trace)
+        reassigned += result["reassignments"]
+        for task_id, assigned_at, pushback in trace:
+            assert pushback >= assigned_at + timedelta(minutes=5), task_id
+    assert reassigned > 0
@@ -0,0 +1,307 @@
+# Offline tuning of the allocation scoring weights.
+#
+# Replays completed days from flight_tasks.db through a simple simulation of
+# the allocator (auto_allocate_tasks every tick, reallocate_overdue every
+# tick, agents walking their queues) for each candidate weight set, spread
+# across a process pool, and ranks them by late pushbacks and flights moved
+# between agents.
+#
+#   python tune_scoring.py --days 7                                   # default grid
+#   python tune_scoring.py --grid type_penalty=0,5,10 --grid overdue_minutes=10,15
+#   python tune_scoring.py --random 300 --workers 8 --write           # save best to scoring.json beside the DB
+
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import fields
+from datetime import datetime, timedelta
+
+import scoring_policy
+from scoring_policy import parse_time
+
+DB_PATH = "flight_tasks.db"
+
+DEFAULT_GRID = {
+    "type_penalty": [0, 5, 10, 20],
+    "task_load_weight": [0, 1, 2, 4],
+    "shift_buffer_minutes": [5, 10, 15, 20],
+    "overdue_minutes": [5, 10, 15, 20],
+}
+RANDOM_RANGES = {
+    "type_penalty": (0, 30),
+    "task_load_weight": (0, 8),
+    "shift_buffer_minutes": (0, 30),
+    "overdue_minutes": (0, 30),
+}
+
+# Simulation assumptions (minutes)
+SERVICE_MINUTES = 8       # pushback and walk-away once hooked up
+TRANSIT_MINUTES = 5       # getting from one bay to the next
+CHANGEOVER_MINUTES = 5    # extra when the tug/bar changes aircraft type
+TICK_MINUTES = 0.25       # the app allocates every 15 seconds
+INFERRED_SHIFT_PAD = timedelta(hours=1)
+
+
+# Loading history
+
+def load_days(conn, days=7, until=None):
+    rows = conn.execute(
+        "SELECT id, aircraft_type, std, etd, assigned_to, completed_at FROM tasks "
+        "WHERE complete = 1 AND completed_at IS NOT NULL AND assigned_to IS NOT NULL"
+    ).fetchall()
+    shift_rows = conn.execute("SELECT username, start, finish FROM shifts").fetchall()
+
+    by_day = defaultdict(list)
+    for task_id, aircraft_type, std, etd, assigned_to, completed_at in rows:
+        try:
+            day = datetime.fromisoformat(completed_at).date()
+        except ValueError:
+            continue
+        task_time = parse_time(etd, day) or parse_time(std, day)
+        if task_time:
+            by_day[day].append({"id": task_id, "time": task_time, "aircraft_type": aircraft_type, "agent": assigned_to})
+
+    selected = sorted(d for d in by_day if until is None or d <= until)[-days:]
+    result = []
+    for day in selected:
+        tasks = sorted(by_day[day], key=lambda t: t["time"])
+        result.append({"date": day, "tasks": tasks, "agents": agent_windows(day, tasks, shift_rows)})
+    return result
+
+
+def agent_windows(day, tasks, shift_rows):
+    # Shift history is not kept, so use today's roster where it covers the
+    # agent and otherwise pad the span of flights they actually worked
+    rostered = {}
+    for username, start, finish in shift_rows:
+        start_dt = parse_time(start, day)
+        end_dt = parse_time(finish, day)
+        if start_dt and end_dt:
+            if end_dt <= start_dt:
+                end_dt += timedelta(days=1)
+            rostered[username] = (start_dt, end_dt)
+
+    worked = defaultdict(list)
+    for t in tasks:
+        worked[t["agent"]].append(t["time"])
+    return {
+        agent: rostered.get(agent, (min(times) - INFERRED_SHIFT_PAD, max(times) + INFERRED_SHIFT_PAD))
+        for agent, times in worked.items()
+    }
+
+
+# Simulation
+
+def simulate_day(policy, day, service=SERVICE_MINUTES, transit=TRANSIT_MINUTES,
+                 changeover=CHANGEOVER_MINUTES, tick=TICK_MINUTES, trace=None):
+    # trace, if given, collects (task id, assigned at, pushback) per flight
+    service = timedelta(minutes=service)
+    transit = timedelta(minutes=transit)
+    changeover = timedelta(minutes=changeover)
+    step = timedelta(minutes=tick)
+
+    tasks = day["tasks"]
+    start = min(min(s for s, _ in day["agents"].values()), tasks[0]["time"] - timedelta(hours=1))
+    end = max(max(e for _, e in day["agents"].values()), tasks[-1]["time"]) + timedelta(hours=1)
+    agents = {
+        name: {"shift": shift, "queue": [], "free_at": shift[0], "last_type": None}
+        for name, shift in day["agents"].items()
+    }
+
+    unassigned = list(tasks)
+    released_from = {}
+    assigned_at = {}
+    result = {"late": 0, "late_minutes": 0.0, "reassignments": 0, "unallocated": 0}
+
+    def arrival(agent, task):
+        # An agent can only set off once they are free and have been given the task
+        move = transit + (changeover if agent["last_type"] and agent["last_type"] != task["aircraft_type"] else timedelta())
+        return max(agent["free_at"], assigned_at[task["id"]]) + move
+
+    now = start
+    while now <= end and (unassigned or any(a["queue"] for a in agents.values())):
+        # Agents push back whatever they have reached by now
+        for agent in agents.values():
+            while agent["queue"]:
+                head = agent["queue"][0]
+                pushback = max(head["time"], arrival(agent, head))
+                if pushback > now:
+                    break
+                if pushback > head["time"]:
+                    result["late"] += 1
+                    result["late_minutes"] += (pushback - head["time"]).total_seconds() / 60
+                if trace is not None:
+                    trace.append((head["id"], assigned_at[head["id"]], pushback))
+                agent["free_at"] = pushback + service
+                agent["last_type"] = head["aircraft_type"]
+                agent["queue"].pop(0)
+
+        # reallocate_overdue: release the next task unless already hooked up
+        for name, agent in agents.items():
+            user_queue = agent["queue"]
+            if len(user_queue) < 2 or now >= arrival(agent, user_queue[0]):
+                continue
+            if policy.is_overdue(user_queue[0]["time"], now):
+                released = user_queue.pop(1)
+                released_from[released["id"]] = name
+                unassigned.append(released)
+
+        # auto_allocate_tasks
+        unassigned.sort(key=lambda t: t["time"])
+        still_unassigned = []
+        for task in unassigned:
+            best_user = None
+            best_score = -float('inf')
+            for name, agent in agents.items():
+                if not policy.in_shift(task["time"], *agent["shift"]):
+                    continue
+                last_task_time = now
+                last_type = None
+                for ut in agent["queue"]:
+                    if ut["time"] > last_task_time:
+                        last_task_time = ut["time"]
+                        last_type = ut["aircraft_type"]
+                score = policy.score(task["time"], task["aircraft_type"], last_task_time, last_type, len(agent["queue"]))
+                # Ties go to the first agent so runs are reproducible
+                if score > best_score:
+                    best_score = score
+                    best_user = name
+            if best_user is None:
+                still_unassigned.append(task)
+                continue
+            if released_from.get(task["id"], best_user) != best_user:
+                result["reassignments"] += 1
+            released_from.pop(task["id"], None)
+            assigned_at[task["id"]] = now
+            agents[best_user]["queue"].append(task)
+            agents[best_user]["queue"].sort(key=lambda t: t["time"])
+        unassigned = still_unassigned
+
+        now += step
+
+    # Anything nobody could take counts against the weights as well
+    result["unallocated"] = len(unassigned) + sum(len(a["queue"]) for a in agents.values())
+    result["late"] += result["unallocated"]
+    return result
+
+
+# Parallel search
+
+worker_days = None
+worker_sim = None
+
+
+def init_worker(days, sim):
+    global worker_days, worker_sim
+    worker_days = days
+    worker_sim = sim
+
+
+def evaluate(config):
+    policy = scoring_policy.build_policy(config)
+    totals = {"late": 0, "late_minutes": 0.0, "reassignments": 0, "unallocated": 0}
+    for day in worker_days:
+        for key, value in simulate_day(policy, day, **worker_sim).items():
+            totals[key] += value
+    return config, totals
+
+
+def grid_configs(grid):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+def random_configs(n, seed):
+    rng = random.Random(seed)
+    return [{k: round(rng.uniform(lo, hi), 1) for k, (lo, hi) in RANDOM_RANGES.items()} for _ in range(n)]
+
+
+def parse_grid(specs):
+    grid = {}
+    known = {f.name for f in fields(scoring_policy.ScoringPolicy)}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        if name not in known or not values:
+            raise SystemExit(f"Bad --grid {spec!r}; expected one of {', '.join(sorted(known))}=v1,v2,...")
+        grid[name] = [float(v) for v in values.split(",")]
+    return grid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune scoring weights against completed days")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--days", type=int, default=7, help="most recent completed days to replay")
+    parser.add_argument("--until", help="last day to include, YYYY-MM-DD")
+    parser.add_argument("--grid", action="append", default=[], metavar="WEIGHT=v1,v2,...")
+    parser.add_argument("--random", type=int, help="sample this many random weight sets instead of a grid")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--late-weight", type=float, default=5, help="cost of a late pushback relative to one reassignment")
+    parser.add_argument("--service-minutes", type=float, default=SERVICE_MINUTES)
+    parser.add_argument("--transit-minutes", type=float, default=TRANSIT_MINUTES)
+    parser.add_argument("--changeover-minutes", type=float, default=CHANGEOVER_MINUTES)
+    parser.add_argument("--tick-minutes", type=float, default=TICK_MINUTES)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--write", action="store_true", help="save the best weights to the scoring config")
+    args = parser.parse_args()
+
+    until = datetime.strptime(args.until, "%Y-%m-%d").date() if args.until else None
+    days = load_days(sqlite3.connect(args.db), days=args.days, until=until)
+    days = [d for d in days if d["tasks"] and d["agents"]]
+    if not days:
+        raise SystemExit("No completed days with assigned flights to replay")
+    print(f"Replaying {len(days)} day(s), {sum(len(d['tasks']) for d in days)} flights")
+
+    config_path = scoring_policy.config_path(args.db)
+    baseline = scoring_policy.load_policy(config_path)
+    base_config = baseline.weights()
+    if type(baseline) is not scoring_policy.ScoringPolicy:
+        raise SystemExit("Tuning only searches the default ScoringPolicy weights")
+
+    if args.random:
+        candidates = random_configs(args.random, args.seed)
+    else:
+        candidates = grid_configs(parse_grid(args.grid) if args.grid else DEFAULT_GRID)
+    # Weights not being searched stay at the current config values
+    configs = [base_config] + [{**base_config, **c} for c in candidates]
+
+    sim = {
+        "service": args.service_minutes,
+        "transit": args.transit_minutes,
+        "changeover": args.changeover_minutes,
+        "tick": args.tick_minutes,
+    }
+    chunksize = max(1, len(configs) // (args.workers * 4))
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(days, sim)) as pool:
+        results = list(pool.map(evaluate, configs, chunksize=chunksize))
+
+    def cost(totals):
+        return totals["late"] * args.late_weight + totals["reassignments"]
+
+    ranked = sorted(results[1:], key=lambda r: (cost(r[1]), r[1]["late_minutes"]))
+    names = [f.name for f in fields(scoring_policy.ScoringPolicy)]
+    header = "".join(f"{n:>22}" for n in names) + f"{'late':>7}{'late min':>10}{'moves':>7}{'cost':>8}"
+    print(header)
+
+    def row(label, config, totals):
+        values = "".join(f"{config[n]:>22g}" for n in names)
+        print(f"{values}{totals['late']:>7}{totals['late_minutes']:>10.0f}{totals['reassignments']:>7}{cost(totals):>8g}  {label}")
+
+    row("current", *results[0])
+    for config, totals in ranked[:args.top]:
+        row("", config, totals)
+
+    best_config, best_totals = ranked[0]
+    if args.write and cost(best_totals) < cost(results[0][1]):
+        scoring_policy.save_policy(scoring_policy.build_policy(best_config), config_path)
+        print(f"✅ Saved best weights to {config_path}")
+    elif args.write:
+        print("Current weights are already the best found; nothing written")
+
+
+if __name__ == "__main__":
+    main()